@@ -1,97 +1,346 @@
 import os
-import time
+import re
+import logging
+import copy
+import asyncio
+import httpx
 import requests
 import json
+from functools import lru_cache
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from dotenv import load_dotenv
-from langchain_community.chat_models import ChatOpenAI  # updated import
+from pydantic import BaseModel
+from langchain_openai import ChatOpenAI
+from langchain_core.messages import HumanMessage, SystemMessage
+from cache import PersistentCache, json_loads
+from diet_rules import DIET_ALIASES, DIET_PATTERNS, filter_diet_rules
 
 # Load environment variables
 load_dotenv()
 RAPIDAPI_KEY = os.getenv("RAPIDAPI_KEY")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+logger = logging.getLogger(__name__)
+RAPIDAPI_RPS = int(os.getenv("RAPIDAPI_RPS", "5"))  # max concurrent Spoonacular requests
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "5"))  # max concurrent LLM calls
+USE_LLM_DIET = os.getenv("USE_LLM_DIET", "false").lower() == "true"  # GPT-4 diet filter instead of local rules
+
+# --- Spoonacular HTTP session (keep-alive, shared connection pool) ---
+SPOONACULAR_HOST = "spoonacular-recipe-food-nutrition-v1.p.rapidapi.com"
+SPOONACULAR_HEADERS = {
+    "x-rapidapi-key": RAPIDAPI_KEY,
+    "x-rapidapi-host": SPOONACULAR_HOST
+}
+SESSION = requests.Session()
+SESSION.headers.update(SPOONACULAR_HEADERS)
+SPOONACULAR_RETRY = Retry(
+    total=5,
+    backoff_factor=1,  # exponential backoff between attempts...
+    backoff_jitter=1.0,  # ...plus up to 1s of random jitter so parallel clients don't retry in lockstep
+    status_forcelist=[429, 500, 502, 503, 504],
+    respect_retry_after_header=True,
+    allowed_methods=["GET"]
+)
+SESSION.mount("https://", HTTPAdapter(pool_connections=10, pool_maxsize=20, max_retries=SPOONACULAR_RETRY))
 
 # Initialize LLM
-llm = ChatOpenAI(model_name="gpt-4", temperature=0, openai_api_key=OPENAI_API_KEY)
+llm = ChatOpenAI(model="gpt-4", temperature=0, api_key=OPENAI_API_KEY)
+extraction_llm = ChatOpenAI(model="gpt-4o-mini", temperature=0, api_key=OPENAI_API_KEY)  # plain copy-out tasks
+
+# --- Prompts (static instructions first, user-specific content last, for provider prefix caching) ---
+ALLERGEN_CHECK_PROMPT = """
+You are an allergen checker.
+Given an ingredient and an allergen, say if the ingredient is considered that allergen.
+Answer only "yes" or "no".
+"""
+
+ALLERGEN_BATCH_PROMPT = """
+You are an allergen checker.
+For each ingredient in list A, and for each allergen in list B, decide if the ingredient is considered that allergen.
+Return ONLY a JSON object of the form {"ingredient": {"allergen": true or false}},
+using the exact ingredient and allergen strings given.
+"""
+
+DIET_FILTER_PROMPT = """
+You are a diet filter.
+From the user's list of recipes, return ONLY the names that match the user's diet.
+"""
+
+RECIPE_FILTER_PROMPT = """
+You are a recipe filter.
+You get the user's diet, the user's allergies, and a list of recipes (index: name — ingredients).
+Keep ONLY the recipes that match the diet and contain none of the allergens,
+and return the indexes to keep.
+"""
+
+EXTRACTION_PROMPT = """
+Extract all recipes from the text given by the user,
+with 'name', 'ingredients' (list) and 'calories' (if available).
+"""
+
+# --- Structured output schemas ---
+class DietFilter(BaseModel):
+    allowed: list[str]  # names of the recipes that match the diet
+
+
+class RecipeFilter(BaseModel):
+    keep: list[int]  # indexes of the recipes to keep
+
+
+class ExtractedRecipe(BaseModel):
+    name: str
+    ingredients: list[str]
+    calories: float | None = None
+
+
+class ExtractedRecipes(BaseModel):
+    recipes: list[ExtractedRecipe]
+
 
-# --- Caches ---
-RECIPE_CACHE = {}       # Spoonacular full recipe info cache
-ALLERGEN_CACHE = {}     # LLM allergen cache
+# Structured-output runnables, built once instead of on every call
+_DIET_FILTER_LLM = llm.with_structured_output(DietFilter, method="function_calling")
+_RECIPE_FILTER_LLM = llm.with_structured_output(RecipeFilter, method="function_calling")
+_EXTRACTION_LLM = extraction_llm.with_structured_output(ExtractedRecipes, method="function_calling")
+
+
+# --- Caches (in-memory TTL + SQLite, survive restarts) ---
+RECIPE_CACHE = PersistentCache("recipe")       # Spoonacular full recipe info cache
+ALLERGEN_CACHE = PersistentCache("allergen")   # LLM allergen cache
+
+# Precomputed answers for common ingredients (built by tools/build_allergen_table.py)
+ALLERGEN_TABLE_PATH = "allergens.json"
+
+
+def load_allergen_table(path: str = ALLERGEN_TABLE_PATH) -> dict:
+    """Load the bundled {"ingredient|allergy": bool} table, if present."""
+    if not os.path.exists(path):
+        return {}
+    with open(path, "rb") as f:
+        return {tuple(k.split("|", 1)): v for k, v in json_loads(f.read()).items()}
+
+
+@lru_cache(maxsize=1)
+def get_allergen_table() -> dict:
+    """Read the allergen table on first use instead of at import time."""
+    return load_allergen_table()
+
+
+def known_allergen(key: tuple) -> bool | None:
+    """Answer for an (ingredient, allergy) pair from the bundled table or the cache, None if unknown."""
+    table = get_allergen_table()
+    if key in table:
+        return table[key]
+    return ALLERGEN_CACHE.get(key)
 
 
 # --- LLM-based helpers ---
+_JSON_FENCE_RE = re.compile(r"^```(?:json)?\s*|\s*```$", re.MULTILINE)
+
+
+def parse_llm_json(response: str):
+    """
+    Parse JSON from a free-form LLM reply, tolerating ```json fences
+    and extra text around the JSON object/array.
+    """
+    cleaned = _JSON_FENCE_RE.sub("", response).strip()
+    try:
+        return json_loads(cleaned)
+    except ValueError:
+        starts = [i for i in (cleaned.find("{"), cleaned.find("[")) if i != -1]
+        if not starts:
+            raise
+        start = min(starts)
+        end = cleaned.rfind("}" if cleaned[start] == "{" else "]")
+        return json_loads(cleaned[start:end + 1])
+
+
 def is_allergen(ingredient: str, allergy: str) -> bool:
-    """Check if an ingredient contains the specified allergen using LLM with caching."""
-    key = (ingredient.lower(), allergy.lower())
-    if key in ALLERGEN_CACHE:
-        return ALLERGEN_CACHE[key]
+    """
+    Check if an ingredient contains the specified allergen using LLM with caching.
+    Both arguments are expected to be lowercase already.
+    """
+    key = (ingredient, allergy)
+    known = known_allergen(key)
+    if known is not None:
+        return known
 
-    prompt = f'Is the ingredient "{ingredient}" considered "{allergy}"? Answer only "yes" or "no".'
+    messages = [
+        SystemMessage(content=ALLERGEN_CHECK_PROMPT),
+        HumanMessage(content=f'Ingredient: "{ingredient}"\nAllergen: "{allergy}"')
+    ]
     try:
-        response = llm.predict(prompt).strip().lower()
-        result = response == "yes"
-    except Exception:
-        result = False
+        response = llm.invoke(messages).content.strip().lower()
+    except Exception as e:
+        # Fail closed and don't cache: an outage must not be remembered as "not an allergen"
+        print(f"⚠️ Allergen check failed for {key}: {e}")
+        return True
 
+    result = response == "yes"
     ALLERGEN_CACHE[key] = result
     return result
 
 
+def classify_allergens(ingredients: set, allergies: list) -> None:
+    """
+    Fill ALLERGEN_CACHE for every (ingredient, allergy) pair using a single batched LLM call.
+    Only pairs not already known (bundled table or cache) are sent to the LLM.
+    If the call fails, the pairs are left unknown (callers treat unknown as unsafe).
+    """
+    missing = {
+        (ing, allergy)
+        for ing in ingredients
+        for allergy in allergies
+        if known_allergen((ing, allergy)) is None
+    }
+    if not missing:
+        return
+
+    ing_list = sorted({ing for ing, _ in missing})
+    allergy_list = sorted({allergy for _, allergy in missing})
+    messages = [
+        SystemMessage(content=ALLERGEN_BATCH_PROMPT),
+        HumanMessage(content=f"A: {json.dumps(ing_list)}\nB: {json.dumps(allergy_list)}")
+    ]
+    try:
+        response = llm.invoke(messages).content
+        grid = parse_llm_json(response)
+        for ing, answers in grid.items():
+            for allergy, value in answers.items():
+                key = (ing.lower(), allergy.lower())
+                if key in missing:
+                    ALLERGEN_CACHE[key] = value is True or str(value).strip().lower() in ("yes", "true")
+    except Exception as e:
+        # Don't retry pair by pair during an outage: that would be one LLM call per pair
+        print(f"⚠️ Batched allergen check failed: {e}")
+        return
+
+    # Anything the batch did not answer falls back to a per-pair check
+    for ing, allergy in missing:
+        if known_allergen((ing, allergy)) is None:
+            is_allergen(ing, allergy)
+
+
 def filter_allergies(recipes: list, allergies: list) -> list:
     """Filter out recipes containing allergens."""
+    if not recipes or not allergies:
+        return recipes
+
+    allergies = [a.lower() for a in allergies]
+    # Lowercase each recipe's ingredients once, reused for batching and filtering
+    lowered = [[ing.lower() for ing in r.get("ingredients", [])] for r in recipes]
+    classify_allergens({ing for ings in lowered for ing in ings}, allergies)
+
     safe_recipes = []
-    for recipe in recipes:
-        if any(is_allergen(ing, allergy) for ing in recipe.get("ingredients", []) for allergy in allergies):
+    for recipe, ings in zip(recipes, lowered):
+        if not ings:  # ingredients unknown: can't be shown to be safe
+            continue
+        # any() stops at the first allergen hit; pairs still unknown (LLM failure) count as hits
+        if any(known_allergen((ing, allergy)) is not False for ing in ings for allergy in allergies):
             continue
         safe_recipes.append(recipe)
     return safe_recipes
 
 
 def filter_diet(recipes: list, diet: str) -> list:
+    """
+    Filter recipes by diet using the local BANNED rules.
+    Uses the LLM only when USE_LLM_DIET is set or the diet has no rules.
+    """
+    if not recipes:
+        return []
+
+    pattern = DIET_PATTERNS.get(DIET_ALIASES.get(diet.lower(), diet.lower()))
+    if USE_LLM_DIET or pattern is None:
+        return filter_diet_llm(recipes, diet)
+    return filter_diet_rules(recipes, pattern)
+
+
+def filter_diet_llm(recipes: list, diet: str) -> list:
     """Use LLM to filter recipes by diet."""
     if not recipes:
         return []
 
     recipe_names = [r["name"] for r in recipes]
-    prompt = f"""
-    You are a diet filter. User diet: {diet}.
-    From this list of recipes, return ONLY the names that match the diet:
-    {recipe_names}
-
-    Return as a JSON list of strings.
-    """
+    messages = [
+        SystemMessage(content=DIET_FILTER_PROMPT),
+        HumanMessage(content=f"Diet: {diet}\nRecipes: {recipe_names}")
+    ]
     try:
-        response = llm.predict(prompt)
-        allowed = json.loads(response)
+        allowed = _DIET_FILTER_LLM.invoke(messages).allowed
         return [r for r in recipes if r["name"] in allowed]
     except Exception:
-        # Fallback for vegetarian
-        if diet == "vegetarian":
-            return [r for r in recipes if not any(
-                meat in " ".join(r["ingredients"]).lower()
-                for meat in ["chicken", "beef", "pork", "fish", "lamb", "turkey"]
-            )]
+        # Fallback to the local rules when we have them
+        pattern = DIET_PATTERNS.get(DIET_ALIASES.get(diet.lower(), diet.lower()))
+        if pattern is not None:
+            return filter_diet_rules(recipes, pattern)
+        return recipes
+
+
+def filter_recipes(recipes: list, allergies: list, diet: str | None) -> list:
+    """
+    Apply the allergy and diet filters.
+    By default the diet is checked with local rules and allergies with the batched, cached
+    allergen check. With USE_LLM_DIET, both are decided together in a single LLM call,
+    falling back to filter_allergies / filter_diet if the call fails.
+    """
+    if not recipes or not (allergies or diet):
+        return recipes
+
+    # Unknown ingredients can't be shown to be safe
+    recipes = [r for r in recipes if r.get("ingredients")]
+    if not recipes:
+        return []
+
+    if not (USE_LLM_DIET and diet):
+        if diet:
+            recipes = filter_diet(recipes, diet)
+        if allergies:
+            recipes = filter_allergies(recipes, allergies)
+        return recipes
+
+    listing = "\n".join(
+        f"{i}: {r.get('name')} — {', '.join(r.get('ingredients', []))}"
+        for i, r in enumerate(recipes)
+    )
+    messages = [
+        SystemMessage(content=RECIPE_FILTER_PROMPT),
+        HumanMessage(content=(
+            f"Diet: {diet or 'none'}\n"
+            f"Allergies: {', '.join(allergies) if allergies else 'none'}\n\n"
+            f"Recipes:\n{listing}"
+        ))
+    ]
+    try:
+        keep = set(_RECIPE_FILTER_LLM.invoke(messages).keep)
+        return [r for i, r in enumerate(recipes) if i in keep]
+    except Exception as e:
+        print(f"⚠️ Combined filter failed: {e}, falling back to separate filters")
+        if allergies:
+            recipes = filter_allergies(recipes, allergies)
+        if diet:
+            recipes = filter_diet_llm(recipes, diet)
         return recipes
 
 
 # --- Spoonacular API helpers ---
-def get_recipe_info(recipe_id: int, retries=5) -> dict:
-    """Fetch full recipe info from Spoonacular with caching."""
+async def aget_recipe_info(client: httpx.AsyncClient, sem: asyncio.Semaphore, recipe_id: int, retries=5) -> dict:
+    """
+    Fetch full recipe info from Spoonacular with caching (async, shares the given client).
+    `sem` bounds how many requests are in flight so bursts stay under the rate limit.
+    """
     if recipe_id in RECIPE_CACHE:
         return RECIPE_CACHE[recipe_id]
 
-    url = f"https://spoonacular-recipe-food-nutrition-v1.p.rapidapi.com/recipes/{recipe_id}/information"
-    headers = {
-        "x-rapidapi-key": RAPIDAPI_KEY,
-        "x-rapidapi-host": "spoonacular-recipe-food-nutrition-v1.p.rapidapi.com"
-    }
+    url = f"https://{SPOONACULAR_HOST}/recipes/{recipe_id}/information"
 
     for attempt in range(retries):
         try:
-            response = requests.get(url, headers=headers)
-            if response.status_code == 429:  # rate limit
-                sleep_time = 2 ** attempt
+            async with sem:
+                response = await client.get(url)
+            if response.status_code == 429:  # rate limit, honor Retry-After when given
+                sleep_time = float(response.headers.get("Retry-After", 2 ** attempt))
                 print(f"429 rate limit, sleeping {sleep_time}s")
-                time.sleep(sleep_time)
+                await asyncio.sleep(sleep_time)
                 continue
             response.raise_for_status()
             data = response.json()
@@ -104,80 +353,134 @@ def get_recipe_info(recipe_id: int, retries=5) -> dict:
             }
             RECIPE_CACHE[recipe_id] = recipe
             return recipe
-        except requests.RequestException as e:
+        except (httpx.HTTPError, ValueError) as e:  # ValueError: body was not valid JSON
             sleep_time = 2 ** attempt
             print(f"Fetch failed (attempt {attempt+1}/{retries}): {e}, sleeping {sleep_time}s")
-            time.sleep(sleep_time)
+            await asyncio.sleep(sleep_time)
             continue
 
     return {"id": recipe_id, "name": "Unknown", "ingredients": [], "calories": None, "sourceUrl": None}
 
 
+async def afetch_recipe_infos(recipe_ids: list) -> list:
+    """Fetch full info for several recipes concurrently (at most RAPIDAPI_RPS at once) over one HTTP client."""
+    # Created per call: a semaphore is bound to the event loop that asyncio.run starts
+    sem = asyncio.Semaphore(RAPIDAPI_RPS)
+    async with httpx.AsyncClient(headers=SPOONACULAR_HEADERS) as client:
+        return list(await asyncio.gather(*[aget_recipe_info(client, sem, rid) for rid in recipe_ids]))
+
+
+def get_recipe_info(recipe_id: int) -> dict:
+    """Fetch full recipe info from Spoonacular with caching."""
+    return asyncio.run(afetch_recipe_infos([recipe_id]))[0]
+
+
+def _recipe_from_search_result(data: dict) -> dict:
+    """Build our recipe dict from a complexSearch result (addRecipeInformation + fillIngredients)."""
+    ingredients = data.get("extendedIngredients") or (data.get("usedIngredients", []) + data.get("missedIngredients", []))
+    recipe = {
+        "id": data["id"],
+        "name": data.get("title"),
+        "ingredients": [i["name"] for i in ingredients],
+        "calories": None,
+        "sourceUrl": data.get("sourceUrl"),
+        "image": data.get("image")
+    }
+    if recipe["ingredients"]:
+        RECIPE_CACHE[recipe["id"]] = recipe
+    return recipe
+
+
 def search_recipes_spoonacular(
     ingredients=None,
     meal_type=None,
     diet=None,
-    number=5,
-    retries=5
+    number=5
 ) -> list:
     """
-    Search recipes via Spoonacular and fetch full info for filtering.
+    Search recipes via Spoonacular, with full info (ingredients, image, source URL) in one request.
+    Identical searches are served from an in-process LRU cache.
     """
-    url = "https://spoonacular-recipe-food-nutrition-v1.p.rapidapi.com/recipes/complexSearch"
+    try:
+        results = _search_recipes_cached(tuple(ingredients or ()), meal_type, diet, number)
+    except IncompleteSearch as e:
+        results = e.results  # usable now, but not memoized so the next search retries the lookups
+    except requests.RequestException as e:
+        print(f"⚠️ Spoonacular search gave up: {e}")
+        return []
+    # Callers tag/mutate results, so never hand out the cached objects
+    return copy.deepcopy(list(results))
+
+
+class IncompleteSearch(Exception):
+    """Raised by _search_recipes_cached when some ingredients could not be fetched (lru_cache skips exceptions)."""
+
+    def __init__(self, results: tuple):
+        super().__init__(f"{sum(not r['ingredients'] for r in results)} recipes without ingredients")
+        self.results = results
+
+
+@lru_cache(maxsize=256)
+def _search_recipes_cached(ingredients: tuple, meal_type, diet, number) -> tuple:
+    """
+    Spoonacular complexSearch. Retries/backoff are handled by the SESSION adapter;
+    raises on failure (or IncompleteSearch if ingredients are still missing) so errors are not cached.
+    """
+    url = f"https://{SPOONACULAR_HOST}/recipes/complexSearch"
     querystring = {
         "includeIngredients": ",".join(ingredients) if ingredients else None,
         "type": meal_type,
         "diet": diet,
         "number": str(number),
-        "addRecipeInformation": "false"  # fetch info separately
+        "addRecipeInformation": "true",  # details come back in the same payload
+        "fillIngredients": "true"
     }
-    headers = {
-        "x-rapidapi-key": RAPIDAPI_KEY,
-        "x-rapidapi-host": "spoonacular-recipe-food-nutrition-v1.p.rapidapi.com"
-    }
-
-    for attempt in range(retries):
-        try:
-            response = requests.get(url, headers=headers, params=querystring)
-            print(f"DEBUG: status {response.status_code}, attempt {attempt+1}")
-            if response.status_code == 429:
-                wait_time = 5 * (attempt + 1)
-                print(f"⚠️ Rate limited, waiting {wait_time}s...")
-                time.sleep(wait_time)
-                continue
 
-            response.raise_for_status()
-            data = response.json()
-            results = [get_recipe_info(r["id"]) for r in data.get("results", [])]
-            return results
-        except requests.RequestException as e:
-            wait_time = 5 * (attempt + 1)
-            print(f"⚠️ Request failed: {e}. Retrying in {wait_time}s...")
-            time.sleep(wait_time)
-            continue
+    response = SESSION.get(url, params=querystring)
+    logger.debug("Spoonacular search status %s", response.status_code)
+    response.raise_for_status()
+    data = response.json()
+    results = [_recipe_from_search_result(r) for r in data.get("results", [])]
 
-    return []
+    # Fall back to per-id lookups (concurrent) only for results missing ingredients
+    missing = [r["id"] for r in results if not r["ingredients"]]
+    if missing:
+        fetched = {info["id"]: info for info in asyncio.run(afetch_recipe_infos(missing))}
+        for r in results:
+            if not r["ingredients"] and r["id"] in fetched:
+                r["ingredients"] = fetched[r["id"]]["ingredients"]
+        if any(not r["ingredients"] for r in results):
+            raise IncompleteSearch(tuple(results))
+    return tuple(results)
 
 
 # --- PDF helper ---
-def extract_recipes_from_pdf(parsed_chunks: list) -> list:
-    """
-    Use LLM to extract structured recipes from PDF text chunks.
-    Each recipe should have name, ingredients list, and optionally calories.
-    """
+async def aextract_recipes_from_pdf(parsed_chunks: list) -> list:
+    """Async version of extract_recipes_from_pdf: chunks are sent to the LLM concurrently (bounded)."""
+    sem = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+
+    async def extract(messages):
+        async with sem:
+            return await _EXTRACTION_LLM.ainvoke(messages)
+
+    messages = [[SystemMessage(content=EXTRACTION_PROMPT), HumanMessage(content=chunk)] for chunk in parsed_chunks]
+    responses = await asyncio.gather(*(extract(m) for m in messages), return_exceptions=True)
+
     recipes = []
-    for chunk in parsed_chunks:
-        prompt = f"""
-        Extract all recipes from the following text.
-        Return JSON list of objects with 'name', 'ingredients' (list), 'calories' (if available):
-        {chunk}
-        """
+    for response in responses:
         try:
-            llm_chain = llm  # can just use llm.predict here
-            response = llm_chain.predict(prompt)
-            extracted = json.loads(response)
-            recipes.extend(extracted)
+            if isinstance(response, Exception):
+                raise response
+            recipes.extend(r.model_dump() for r in response.recipes)
         except Exception as e:
             print(f"PDF extraction failed: {e}")
             continue
     return recipes
+
+
+def extract_recipes_from_pdf(parsed_chunks: list) -> list:
+    """
+    Use LLM to extract structured recipes from PDF text chunks.
+    Each recipe should have name, ingredients list, and optionally calories.
+    """
+    return asyncio.run(aextract_recipes_from_pdf(parsed_chunks))
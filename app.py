@@ -1,7 +1,48 @@
 import streamlit as st
 import re
+import llm_cache  # noqa: F401  (enables the global LLM cache before any model is used)
 from graph import build_graph
 
+def render_results(results: list[dict]):
+    """Display recipes (Spoonacular first, PDF recipes appended when ready)."""
+    st.subheader("🍴 Recommended Recipes")
+    for r in results:
+        # Recipe title + link
+        if r.get("sourceUrl"):
+            st.markdown(f"### [{r['name']}]({r['sourceUrl']}) ({r.get('source', 'Unknown')})")
+        else:
+            st.markdown(f"### {r['name']} ({r.get('source', 'Unknown')})")
+
+        # Recipe image
+        if r.get("image"):
+            st.image(r["image"], width=300)
+
+        # Description
+        if r.get("description"):
+            st.write(r["description"])
+
+        # Calories
+        if r.get("calories"):
+            st.write(f"**Calories:** {r['calories']} kcal")
+
+        # Ingredients
+        if r.get("ingredients"):
+            st.write("**Ingredients:**")
+            for ing in r["ingredients"]:
+                st.write(f"- {ing}")
+
+        # Instructions
+        if r.get("instructions"):
+            st.write("**Instructions:**")
+            # Split instructions into steps for readability
+            steps = re.split(r"\s*\d+\.\s*", r["instructions"])
+            for step in steps:
+                if step.strip():
+                    st.write(f"- {step.strip()}")
+
+        st.divider()
+
+
 def main():
     st.set_page_config(page_title="Healthy Recipe Copilot", page_icon="🥗")
     st.title("🥗 Healthy Recipe Copilot")
@@ -14,6 +55,9 @@ def main():
     diet_options = ["None", "Vegetarian", "Vegan", "Pescatarian", "Gluten-Free", "Lactose-Free"]
     diet_choice = st.selectbox("Diet Preference", diet_options)
 
+    # Compiled once per process (cached in build_graph), reused for every query
+    graph = build_graph()
+
     if st.button("Find Recipes"):
         if not query:
             st.warning("Please enter a query.")
@@ -35,51 +79,23 @@ def main():
             "results": []
         }
 
-        # --- Build and run the graph ---
-        graph = build_graph()
-        final_state = graph.invoke(state)
-        results = final_state.get("results", [])
+        # --- Run the graph, rendering results as soon as each step emits them ---
+        # "values": state after each node; "custom": single PDF recipes while they are being extracted
+        results_ph = st.empty()
+        results = []
+        with st.spinner("Searching recipes..."):
+            for mode, event in graph.stream(state, stream_mode=["values", "custom"]):
+                if mode == "custom":
+                    new_results = results + [event["pdf_recipe"]]
+                else:
+                    new_results = event.get("results") or results
+                if new_results != results:
+                    results = new_results
+                    with results_ph.container():
+                        render_results(results)
 
-        # --- Display results ---
         if not results:
             st.error("No recipes found matching your filters.")
-        else:
-            st.subheader("🍴 Recommended Recipes")
-            for r in results:
-                # Recipe title + link
-                if r.get("sourceUrl"):
-                    st.markdown(f"### [{r['name']}]({r['sourceUrl']}) ({r.get('source', 'Unknown')})")
-                else:
-                    st.markdown(f"### {r['name']} ({r.get('source', 'Unknown')})")
-
-                # Recipe image
-                if r.get("image"):
-                    st.image(r["image"], width=300)
-
-                # Description
-                if r.get("description"):
-                    st.write(r["description"])
-
-                # Calories
-                if r.get("calories"):
-                    st.write(f"**Calories:** {r['calories']} kcal")
-
-                # Ingredients
-                if r.get("ingredients"):
-                    st.write("**Ingredients:**")
-                    for ing in r["ingredients"]:
-                        st.write(f"- {ing}")
-
-                # Instructions
-                if r.get("instructions"):
-                    st.write("**Instructions:**")
-                    # Split instructions into steps for readability
-                    steps = re.split(r"\s*\d+\.\s*", r["instructions"])
-                    for step in steps:
-                        if step.strip():
-                            st.write(f"- {step.strip()}")
-
-                st.divider()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,99 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from cachetools import TTLCache
+
+# orjson (optional) parses and serializes several times faster than the stdlib json module
+try:
+    import orjson
+
+    json_loads = orjson.loads
+
+    def json_dumps(value) -> str:
+        return orjson.dumps(value).decode()
+except ImportError:
+    json_loads = json.loads
+    json_dumps = json.dumps
+
+# -------------------------
+# Config
+# -------------------------
+CACHE_DB = os.getenv("CACHE_DB", "agent_cache.db")
+CACHE_TTL = 86400        # seconds (1 day)
+CACHE_MAXSIZE = 10_000   # entries kept in memory per cache
+
+
+def make_key(key) -> str:
+    """Hash any JSON-serializable key (str, int, tuple...) into a stable sha256 hex digest."""
+    return hashlib.sha256(json.dumps(key).encode()).hexdigest()
+
+
+class PersistentCache:
+    """
+    Dict-like cache with two layers:
+    an in-memory TTLCache in front of an SQLite table that survives process restarts.
+    Values must be JSON-serializable.
+    """
+
+    def __init__(self, table: str, db_path: str = CACHE_DB, ttl: int = CACHE_TTL, maxsize: int = CACHE_MAXSIZE):
+        self.table = table
+        self.ttl = ttl
+        self._memory = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._db = None  # opened on first use, so importing a module that defines a cache touches no disk
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        """SQLite connection, created (with its table) on first access. Call with self._lock held."""
+        if self._db is None:
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+            with self._db:
+                self._db.execute(
+                    f"CREATE TABLE IF NOT EXISTS {self.table} (key TEXT PRIMARY KEY, val TEXT NOT NULL, ts INTEGER NOT NULL)"
+                )
+        return self._db
+
+    def _lookup(self, key):
+        """Return (found, value), checking memory first and falling through to SQLite."""
+        hashed = make_key(key)
+        with self._lock:
+            if hashed in self._memory:
+                return True, self._memory[hashed]
+
+            row = self._conn.execute(
+                f"SELECT val FROM {self.table} WHERE key = ? AND ts >= ?",
+                (hashed, int(time.time()) - self.ttl),
+            ).fetchone()
+            if row is None:
+                return False, None
+
+            value = json_loads(row[0])
+            self._memory[hashed] = value
+            return True, value
+
+    def __contains__(self, key) -> bool:
+        return self._lookup(key)[0]
+
+    def __getitem__(self, key):
+        found, value = self._lookup(key)
+        if not found:
+            raise KeyError(key)
+        return value
+
+    def get(self, key, default=None):
+        found, value = self._lookup(key)
+        return value if found else default
+
+    def __setitem__(self, key, value) -> None:
+        hashed = make_key(key)
+        with self._lock:
+            self._memory[hashed] = value
+            with self._conn:
+                self._conn.execute(
+                    f"INSERT OR REPLACE INTO {self.table} (key, val, ts) VALUES (?, ?, ?)",
+                    (hashed, json_dumps(value), int(time.time())),
+                )
@@ -0,0 +1,49 @@
+import re
+
+# --- Diet rules (local, no LLM) ---
+_MEAT = {"meat", "chicken", "beef", "pork", "lamb", "turkey", "veal", "duck", "bacon", "ham",
+         "sausage", "salami", "chorizo", "prosciutto", "pancetta", "gelatin", "gelatine", "lard", "suet"}
+_SEAFOOD = {"fish", "salmon", "tuna", "cod", "trout", "tilapia", "halibut", "sardine", "anchovy", "anchovies",
+            "shrimp", "prawn", "crab", "lobster", "mussel", "clam", "scallop", "oyster", "squid"}
+_DAIRY = {"milk", "cheese", "butter", "cream", "yogurt", "yoghurt", "ghee", "whey", "buttermilk",
+          "parmesan", "mozzarella", "feta", "ricotta", "cheddar", "mascarpone"}
+_OTHER_ANIMAL = {"egg", "honey", "mayonnaise"}
+_GLUTEN = {"wheat", "barley", "rye", "spelt", "flour", "bread", "breadcrumbs", "pasta", "noodle",
+           "couscous", "bulgur", "semolina", "seitan", "tortilla", "panko"}
+
+BANNED = {
+    "vegetarian": _MEAT | _SEAFOOD,
+    "pescatarian": _MEAT,
+    "vegan": _MEAT | _SEAFOOD | _DAIRY | _OTHER_ANIMAL,
+    "gluten-free": _GLUTEN,
+    "lactose-free": _DAIRY,
+}
+DIET_ALIASES = {
+    "pescetarian": "pescatarian",
+    "gluten free": "gluten-free",
+    "lactose free": "lactose-free",
+    "dairy-free": "lactose-free",
+    "dairy free": "lactose-free",
+}
+
+# Whole-word match (plus plural), compiled once per diet
+DIET_PATTERNS = {
+    diet: re.compile(r"\b(?:" + "|".join(sorted(map(re.escape, words))) + r")(?:e?s)?\b")
+    for diet, words in BANNED.items()
+}
+# Plant-based / gluten-free products that contain a banned word
+DIET_EXCEPTIONS_RE = re.compile(
+    r"\b(?:(?:almond|coconut|oat|soy|rice|cashew|peanut)\s+(?:milk|butter|cream|yogurt|cheese)"
+    r"|(?:almond|coconut|rice|chickpea|corn|buckwheat|gluten[- ]free)\s+(?:flour|pasta|bread|noodles|tortillas?)"
+    r"|(?:vegan|plant[- ]based|dairy[- ]free|non[- ]dairy)\s+[\w -]*\w"  # the rest of the name
+    r"|butter\s+beans?|cocoa\s+butter|cream of tartar)\b"
+)
+
+
+def filter_diet_rules(recipes: list, pattern: re.Pattern) -> list:
+    """Drop recipes with any ingredient matching the diet's banned-ingredient pattern."""
+    return [
+        r for r in recipes
+        if r.get("ingredients")  # ingredients unknown: can't be shown to fit the diet
+        and not any(pattern.search(DIET_EXCEPTIONS_RE.sub("", ing.lower())) for ing in r.get("ingredients", []))
+    ]
@@ -1,17 +1,33 @@
 from dotenv import load_dotenv
 import os
-import json
+from typing import Literal
+import streamlit as st
 from pydantic import BaseModel
 from langchain_openai import ChatOpenAI 
+from langchain_core.messages import HumanMessage, SystemMessage
 from langgraph.graph import StateGraph, START, END
-from agent_tools import search_recipes_spoonacular, filter_allergies, filter_diet
-from pdf_rag import query_pdf_structured
+from langgraph.config import get_stream_writer
+from agent_tools import search_recipes_spoonacular, filter_recipes
+from pdf_rag import query_pdf_structured, stream_pdf_recipes
 
 load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
 llm = ChatOpenAI(model="gpt-4", temperature=0, api_key=OPENAI_API_KEY)
 
+# Static instructions go in the system message and the query last, so the prefix is cacheable
+CLASSIFY_SYSTEM_PROMPT = """
+You are a smart recipe assistant. Analyse the user's query:
+
+1️⃣ Determine intent:
+    - "ingredients" if user specifies ingredients
+    - "profile" if user asks generally (like "I want a healthy lunch")
+
+2️⃣ Detect meal type (breakfast, lunch, dinner, snack), or leave empty if not clear.
+
+3️⃣ Detect diet if mentioned (vegetarian, vegan, pescetarian, gluten-free), or leave empty.
+"""
+
 # -------------------------
 # State model
 # -------------------------
@@ -25,6 +41,15 @@ class RecipeState(BaseModel):
     results: list[dict] = []
 
 
+class Intent(BaseModel):
+    intent: Literal["ingredients", "profile"] = "profile"
+    meal_type: str | None = None
+    diet: str | None = None
+
+
+_INTENT_LLM = llm.with_structured_output(Intent, method="function_calling")
+
+
 # -------------------------
 # Nodes
 # -------------------------
@@ -32,33 +57,12 @@ def classify_intent(state: RecipeState) -> RecipeState:
     """
     Determine intent, meal type, and diet from user query.
     """
-    prompt = f"""
-You are a smart recipe assistant.
-User query: "{state.query}"
-
-1️⃣ Determine intent:
-    - "ingredients" if user specifies ingredients
-    - "profile" if user asks generally (like "I want a healthy lunch")
-
-2️⃣ Detect meal type (breakfast, lunch, dinner, snack), or leave empty if not clear.
-
-3️⃣ Detect diet if mentioned (vegetarian, vegan, pescetarian, gluten-free), or leave empty.
-
-Respond in JSON like:
-{{
-    "intent": "profile",
-    "meal_type": "lunch",
-    "diet": "vegetarian"
-}}
-"""
+    messages = [SystemMessage(content=CLASSIFY_SYSTEM_PROMPT), HumanMessage(content=state.query)]
     try:
-        response = llm.predict(prompt).strip()
-        parsed = json.loads(response)
-        intent = parsed.get("intent", "profile").lower()
-        meal_type = parsed.get("meal_type")
-        diet = parsed.get("diet")
-        if intent not in ["ingredients", "profile"]:
-            intent = "profile"
+        parsed = _INTENT_LLM.invoke(messages)
+        intent = parsed.intent
+        meal_type = parsed.meal_type or None
+        diet = parsed.diet or None
     except Exception as e:
         print(f"⚠️ classify_intent failed: {e}")
         intent = "profile"
@@ -76,156 +80,96 @@ Respond in JSON like:
     return state
 
 
-def ingredients_flow(state: RecipeState) -> RecipeState:
+def spoonacular_flow(state: RecipeState) -> RecipeState:
     """
-    Search recipes by ingredients via Spoonacular API,
-    apply diet/allergy filters, and include structured PDF recipes.
+    Search recipes via Spoonacular (by ingredients or by general profile, depending on intent)
+    and apply diet/allergy filters. Runs before the PDF flow so the UI can show these results first.
     """
-    print(f"🥕 Entering ingredients_flow with query='{state.query}'")
+    print(f"🔎 Entering spoonacular_flow (intent='{state.intent}') with query='{state.query}'")
 
     # Spoonacular search
+    ingredients = [state.query] if state.intent == "ingredients" else []
     results = search_recipes_spoonacular(
-        ingredients=[state.query],
+        ingredients=ingredients,
         meal_type=state.meal_type,
-        diet=None,  # We filter manually via LLM
+        diet=None,  # We filter ourselves (see filter_recipes)
         number=5
     )
 
-    print(f"🔍 Found {len(results)} Spoonacular results before filtering. Diet={state.diet}, Allergies={state.allergies}")
-
-    # Filter by allergies 
-    if state.allergies:
-        results = filter_allergies(results, state.allergies)
-        print(f"🚫 After allergy filter: {len(results)} recipes remain")
-
-    # Filter by diet 
-    if state.diet:
-        print(f"🥗 Applying diet filter: {state.diet}")
-        results = filter_diet(results, state.diet)
-        print(f"✅ After diet filter: {len(results)} recipes remain")
+    print(f"🔍 Found {len(results)} Spoonacular results. Diet={state.diet}, Allergies={state.allergies}")
 
-    # Tag Spoonacular results 
+    # Tag Spoonacular results
     for r in results:
         r["source"] = "Spoonacular"
         r["sourceUrl"] = r.get("sourceUrl")
         r["image"] = r.get("image", None)
 
-    # Add PDF results 
-    parsed = query_pdf_structured(state.query)
-    if parsed:
-        print(f"📖 Adding {len(parsed)} PDF recipes")
-        pdf_recipes = parsed if isinstance(parsed, list) else [parsed]
-        for r in pdf_recipes:
-            # Filter PDF by diet if needed
-            if state.diet:
-                allowed = filter_diet([r], state.diet)
-                if not allowed:
-                    continue
-            r["source"] = "PDF"
-            r["sourceUrl"] = None
-            r["image"] = None
-            results.append(r)
+    # Filter by allergies and diet
+    if state.allergies or state.diet:
+        results = filter_recipes(results, state.allergies, state.diet)
+        print(f"✅ After allergy/diet filter: {len(results)} Spoonacular recipes remain")
 
     state.results = results
-    print(f"🏁 ingredients_flow finished with {len(state.results)} recipes")
+    print(f"🏁 spoonacular_flow finished with {len(state.results)} recipes")
     return state
 
 
-def profile_flow(state: RecipeState) -> RecipeState:
-    """
-    Search recipes based on general profile queries,
-    apply diet/allergy filters, and include structured PDF recipes.
-    """
-    print(f"🍽️ Entering profile_flow with query='{state.query}'")
-
-    # Spoonacular search 
-    results = search_recipes_spoonacular(
-        ingredients=[],
-        meal_type=state.meal_type,
-        diet=None,  # We filter manually via LLM
-        number=5
-    )
-
-    print(f"🔍 Found {len(results)} Spoonacular results before filtering. Diet={state.diet}, Allergies={state.allergies}")
-
-    # Filter by allergies 
-    if state.allergies:
-        results = filter_allergies(results, state.allergies)
-        print(f"🚫 After allergy filter: {len(results)} recipes remain")
+def tag_pdf_recipe(r: dict) -> dict:
+    """Tag a PDF recipe with the fields the UI expects."""
+    r["source"] = "PDF"
+    r["sourceUrl"] = None
+    r["image"] = None
+    return r
 
-    # Filter by diet
-    if state.diet:
-        print(f"🥗 Applying diet filter: {state.diet}")
-        results = filter_diet(results, state.diet)
-        print(f"✅ After diet filter: {len(results)} recipes remain")
 
-    # Tag Spoonacular results
-    for r in results:
-        r["source"] = "Spoonacular"
-        r["sourceUrl"] = r.get("sourceUrl")
-        r["image"] = r.get("image", None)
-
-    # Add PDF results 
-    parsed = query_pdf_structured(state.query)
-    if parsed:
-        print(f"📖 Adding {len(parsed)} PDF recipes")
-        pdf_recipes = parsed if isinstance(parsed, list) else [parsed]
-        for r in pdf_recipes:
-            # Filter PDF by diet if needed
-            if state.diet:
-                allowed = filter_diet([r], state.diet)
-                if not allowed:
-                    continue
-            r["source"] = "PDF"
-            r["sourceUrl"] = None
-            r["image"] = None
-            results.append(r)
-
-    state.results = results
-    print(f"🏁 profile_flow finished with {len(state.results)} recipes")
-    return state
-
-
-# -------------------------
-# Routing
-# -------------------------
-def route_by_intent(state: RecipeState):
+def pdf_flow(state: RecipeState) -> RecipeState:
     """
-    Route to the correct flow based on intent.
-    PDF recipes are included automatically inside each flow.
+    Add structured PDF recipes (diet/allergy filtered) after the Spoonacular results.
     """
-    next_node = "ingredients_flow" if state.intent == "ingredients" else "profile_flow"
-    print(f"🚦 Routing intent='{state.intent}' → {next_node}")
-    return next_node
+    print(f"📚 Entering pdf_flow with query='{state.query}'")
+
+    if state.allergies or state.diet:
+        # Filtering needs the whole batch (one batched allergen check), so wait for all recipes
+        pdf_recipes = [tag_pdf_recipe(r) for r in query_pdf_structured(state.query) if r]
+        print(f"📖 Found {len(pdf_recipes)} PDF recipes")
+        if pdf_recipes:
+            pdf_recipes = filter_recipes(pdf_recipes, state.allergies, state.diet)
+            print(f"✅ After allergy/diet filter: {len(pdf_recipes)} PDF recipes remain")
+    else:
+        # Nothing to filter: send each recipe to the UI (stream_mode="custom") as soon as it's extracted
+        writer = get_stream_writer()
+        pdf_recipes = []
+        try:
+            for r in stream_pdf_recipes(state.query):
+                pdf_recipes.append(tag_pdf_recipe(r))
+                writer({"pdf_recipe": pdf_recipes[-1]})
+        except Exception as e:
+            print(f"PDF extraction error: {e}")
+        print(f"📖 Found {len(pdf_recipes)} PDF recipes")
+
+    state.results = state.results + pdf_recipes
+    print(f"🏁 pdf_flow finished with {len(state.results)} recipes")
+    return state
 
 
 # -------------------------
 # Build graph
 # -------------------------
+@st.cache_resource
 def build_graph():
+    """Build and compile the agent graph (compiled once per process)."""
     graph = StateGraph(RecipeState)
 
     # Add nodes
     graph.add_node(classify_intent)
-    graph.add_node(profile_flow)
-    graph.add_node(ingredients_flow)
+    graph.add_node(spoonacular_flow)
+    graph.add_node(pdf_flow)
 
-    # Start edge
+    # Edges: both intents share the same flow; Spoonacular results are emitted before PDF ones
     graph.add_edge(START, "classify_intent")
-
-    # Conditional routing
-    graph.add_conditional_edges(
-        "classify_intent",
-        route_by_intent,
-        {
-            "profile_flow": "profile_flow",
-            "ingredients_flow": "ingredients_flow",
-        },
-    )
-
-    # End edges
-    graph.add_edge("profile_flow", END)
-    graph.add_edge("ingredients_flow", END)
+    graph.add_edge("classify_intent", "spoonacular_flow")
+    graph.add_edge("spoonacular_flow", "pdf_flow")
+    graph.add_edge("pdf_flow", END)
 
     print("⚡ Graph built and compiled.")
     return graph.compile()
@@ -0,0 +1,11 @@
+from langchain.globals import set_llm_cache
+from langchain_community.cache import SQLiteCache
+
+# -------------------------
+# Global LLM cache
+# -------------------------
+# Every ChatOpenAI call (temperature=0) checks this cache before hitting the API,
+# so identical prompts across Streamlit reruns are answered from SQLite.
+LLM_CACHE_PATH = ".langchain.db"
+
+set_llm_cache(SQLiteCache(database_path=LLM_CACHE_PATH))
@@ -1,131 +1,531 @@
 import os
-import json
 import re
+import json
+import logging
+import copy
+import time
+import pickle
+import hashlib
+import math
+from uuid import uuid4
+from collections.abc import Iterator
+import threading
+import atexit
+from concurrent.futures import ProcessPoolExecutor
+from pydantic import BaseModel
+import faiss
+import numpy as np
+import streamlit as st
 from dotenv import load_dotenv
 from langchain_openai import OpenAIEmbeddings, ChatOpenAI
 from langchain_community.vectorstores import FAISS
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores.utils import DistanceStrategy
+from langchain_core.documents import Document
 from langchain_community.document_loaders import PyPDFLoader
-from langchain.prompts import PromptTemplate
-from langchain_core.runnables import RunnableSequence
+from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_core.output_parsers.openai_tools import JsonOutputKeyToolsParser
+import llm_cache  # noqa: F401  (exact-match LLM cache, also when used outside app.py)
+from cache import PersistentCache
 
 load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+logger = logging.getLogger(__name__)
 
 # -------------------------
 # Config
 # -------------------------
 PERSIST_DIR = "faiss_index"
+RECIPE_STORE_FILE = "recipes.json"  # structured recipes, column per field, aligned with the FAISS rows
+RECIPE_STORE_CONCURRENCY = 8        # parallel extraction calls while building the store
 PDF_PATHS = ["PDF/healthy-cookbook.pdf"]
-llm = ChatOpenAI(model="gpt-4", temperature=0, api_key=OPENAI_API_KEY)
+PDF_TEXT_CACHE_DIR = ".cache/pdftext"
+IVF_NPROBE = 8                # clusters visited per query on IVF indexes
+IVF_MIN_POINTS_PER_LIST = 39  # below this many vectors per cluster, keep a flat index
+MMR_SEARCH_KWARGS = {"k": 3, "fetch_k": 10, "lambda_mult": 0.5}  # 3 diverse recipes out of 10 candidates
+MAX_PROMPT_CHARS = 16_000    # ~4k tokens of retrieved text per extraction call
+PDF_RESULT_CACHE = PersistentCache("pdf_query")  # exact query -> parsed recipes
+QUERY_CACHE_PATH = "query_cache.pkl"
+QUERY_CACHE_THRESHOLD = 0.95  # cosine similarity needed to reuse a cached answer
+QUERY_CACHE_MAX_ENTRIES = 1000  # least recently used entries are evicted beyond this
+QUERY_CACHE_SAVE_INTERVAL = 30  # seconds between rewrites of query_cache.pkl (also saved at exit)
+# Extraction only copies ingredients/steps out of already-retrieved text: a small model is enough
+llm = ChatOpenAI(model="gpt-4o-mini", temperature=0, api_key=OPENAI_API_KEY)
+# Single shared embeddings client: index build, retrieval and the semantic cache all reuse
+# its HTTP connection pool. chunk_size = texts per request when building the index.
+embeddings = OpenAIEmbeddings(api_key=OPENAI_API_KEY, chunk_size=1000, max_retries=6)
+
+# LLM prompt: force line-by-line ingredients and full instructions
+RECIPE_SYSTEM_PROMPT = """
+You are a helpful recipe assistant.
+Extract COMPLETE recipes from the text given by the user, without omitting any ingredients or instructions.
+For each recipe give its name, how many it serves (or null), the ingredients and the instructions ("step 1. step 2. step 3.").
+Instructions:
+- Keep each ingredient as one item in the list (do not merge multiple ingredients into one line).
+- Preserve all steps of the instructions, including multi-line notes.
+"""
+
+# -------------------------
+# Structured output schema
+# -------------------------
+class Recipe(BaseModel):
+    name: str
+    serves: str | None = None
+    ingredients: list[str]
+    instructions: str
+
+class RecipeList(BaseModel):
+    recipes: list[Recipe]
+
+# Built once at import rather than per query. Forced tool call, streamed as partial JSON arguments
+# so each recipe can be handed out as soon as it is complete
+_RECIPE_STREAM = (
+    llm.bind_tools([RecipeList], tool_choice="RecipeList")
+    | JsonOutputKeyToolsParser(key_name="RecipeList", first_tool_only=True)
+)
 
 # -------------------------
 # Helpers
 # -------------------------
+# Recipe boundaries: an upper-case title line followed by 'Serves:' or 'INGREDIENTS:'.
+# google-re2 (optional) scans in linear time; it has no lookahead, so we find the
+# start offsets of each match and slice the text there (same result as splitting with a lookahead).
+try:
+    import re2 as _regex_engine
+except ImportError:
+    _regex_engine = re
+_RECIPE_START_RE = _regex_engine.compile(r"(?m)^[A-Z][A-Z0-9 &\-']+\s*(?:Serves:|INGREDIENTS:)")
+
 def split_recipes_from_text(text: str) -> list[str]:
     """
     Split PDF text into full recipes based on 'Serves' or 'INGREDIENTS:' markers.
     Keeps the full ingredient and instruction blocks intact.
     """
-    # Use a positive lookahead to keep the delimiter
-    pattern = r"(?=^[A-Z][A-Z0-9 &\-']+\s*(?:Serves:|INGREDIENTS:))"
-    parts = re.split(pattern, text, flags=re.MULTILINE)
+    bounds = [0] + [m.start() for m in _RECIPE_START_RE.finditer(text)] + [len(text)]
+    parts = (text[start:end] for start, end in zip(bounds, bounds[1:]))
     return [p.strip() for p in parts if p.strip()]
 
+def extract_pdf_text(pdf: str) -> str:
+    """
+    Extract the raw text of a PDF, cached on disk by the PDF's content hash
+    so index rebuilds don't have to parse the PDF again.
+    """
+    with open(pdf, "rb") as f:
+        key = hashlib.sha256(f.read()).hexdigest()
+    cache_file = os.path.join(PDF_TEXT_CACHE_DIR, f"{key}.txt")
+    if os.path.exists(cache_file):
+        with open(cache_file, encoding="utf-8") as f:
+            return f.read()
+
+    loader = PyPDFLoader(pdf)
+    # Stream pages instead of materializing every Document up front
+    raw_text = "\n".join(p.page_content for p in loader.lazy_load())
+
+    os.makedirs(PDF_TEXT_CACHE_DIR, exist_ok=True)
+    with open(cache_file, "w", encoding="utf-8") as f:
+        f.write(raw_text)
+    return raw_text
+
 def load_and_split_pdfs(pdf_paths: list[str]) -> list[str]:
     """
     Load PDFs and split them into recipe-level chunks.
+    Page parsing is CPU-bound, so several PDFs are parsed in parallel worker processes.
     """
-    all_recipes = []
     for pdf in pdf_paths:
         if not os.path.exists(pdf):
             raise FileNotFoundError(f"PDF not found: {pdf}")
-        loader = PyPDFLoader(pdf)
-        pages = loader.load()
-        raw_text = "\n".join([p.page_content for p in pages])
-        recipes = split_recipes_from_text(raw_text)
-        all_recipes.extend(recipes)
+
+    if len(pdf_paths) > 1:
+        with ProcessPoolExecutor(max_workers=min(len(pdf_paths), os.cpu_count() or 1)) as ex:
+            texts = list(ex.map(extract_pdf_text, pdf_paths))
+    else:
+        # Not worth spawning a pool for a single PDF
+        texts = [extract_pdf_text(pdf) for pdf in pdf_paths]
+
+    all_recipes = []
+    for raw_text in texts:
+        all_recipes.extend(split_recipes_from_text(raw_text))
     return all_recipes
 
 # -------------------------
 # Vectorstore
 # -------------------------
+def build_faiss_index(vectors: list[list[float]]) -> faiss.Index:
+    """
+    Build the recipe index on L2-normalized vectors with inner-product (= cosine) scoring,
+    stored as 8-bit scalar-quantized codes.
+    Large corpora get an IVF index (search only visits nprobe of the nlist clusters);
+    small ones stay on an exact flat index, since IVF training needs ~39 vectors
+    per cluster to give sensible centroids.
+    """
+    data = np.array(vectors, dtype="float32")
+    faiss.normalize_L2(data)
+    dim = data.shape[1]
+    nlist = max(4, int(math.sqrt(len(data))))
+
+    # Vectors are stored as int8 codes (QT_8bit): 4x less memory traffic per scanned vector
+    if len(data) < IVF_MIN_POINTS_PER_LIST * nlist:
+        index = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT)
+        index.train(data)
+        index.add(data)
+        return index
+
+    quantizer = faiss.IndexFlatIP(dim)
+    index = faiss.IndexIVFScalarQuantizer(
+        quantizer, dim, nlist, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT
+    )
+    index.train(data)
+    index.add(data)
+    index.nprobe = IVF_NPROBE
+    index.make_direct_map()  # MMR needs reconstruct() by id
+    return index
+
+def _mmap_flags(index_path: str) -> int:
+    """
+    faiss.read_index flags that memory-map the stored vectors of this index type.
+    IO_FLAG_MMAP only maps IVF inverted lists; flat and scalar-quantizer indexes
+    need IO_FLAG_MMAP_IFC to map their code array. The type comes from the file's fourcc.
+    """
+    with open(index_path, "rb") as f:
+        fourcc = f.read(4)
+    if fourcc[:2] in (b"Iw", b"Iv"):  # IndexIVF* (IwSq, IwFl, IwPQ, ... and older IvXX)
+        return faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+    return faiss.IO_FLAG_MMAP_IFC
+
+def load_vectorstore(persist_dir: str = PERSIST_DIR) -> FAISS:
+    """
+    Load an index written by FAISS.save_local, memory-mapping the vectors instead of reading
+    them into RAM: pages are loaded on demand and shared between processes via the page cache.
+    """
+    index_path = os.path.join(persist_dir, "index.faiss")
+    index = faiss.read_index(index_path, _mmap_flags(index_path))
+    with open(os.path.join(persist_dir, "index.pkl"), "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+
+    if index.metric_type == faiss.METRIC_INNER_PRODUCT:
+        # Cosine index (normalized vectors, inner product); queries are normalized in stream_pdf_recipes
+        return FAISS(
+            embeddings,
+            index,
+            docstore,
+            index_to_docstore_id,
+            distance_strategy=DistanceStrategy.MAX_INNER_PRODUCT
+        )
+    return FAISS(embeddings, index, docstore, index_to_docstore_id)
+
 def ensure_vectorstore(persist_dir: str = PERSIST_DIR):
     if os.path.exists(persist_dir):
-        embeddings = OpenAIEmbeddings(api_key=OPENAI_API_KEY)
-        return FAISS.load_local(persist_dir, embeddings, allow_dangerous_deserialization=True)
+        return load_vectorstore(persist_dir)
 
     print("⚡ FAISS index not found. Building from PDF...")
     recipes = load_and_split_pdfs(PDF_PATHS)
-    embeddings = OpenAIEmbeddings(api_key=OPENAI_API_KEY)
 
-    # Each recipe is a "document"
-    from langchain.schema import Document
-    docs = [Document(page_content=recipe) for recipe in recipes]
+    # Each recipe is a "document"; embed them all in batched requests up front
+    # (progress bar only here, not on every embed_query)
+    build_embeddings = embeddings.model_copy(update={"show_progress_bar": True})
+    vectors = build_embeddings.embed_documents(recipes)
 
-    vectordb = FAISS.from_documents(docs, embeddings)
+    ids = [str(uuid4()) for _ in recipes]
+    # "row" links each document to its structured recipe in the recipe store
+    docstore = InMemoryDocstore({
+        i: Document(page_content=recipe, metadata={"row": row})
+        for row, (i, recipe) in enumerate(zip(ids, recipes))
+    })
+    vectordb = FAISS(
+        embeddings,
+        build_faiss_index(vectors),
+        docstore,
+        dict(enumerate(ids)),
+        distance_strategy=DistanceStrategy.MAX_INNER_PRODUCT
+    )
     vectordb.save_local(persist_dir)
+
+    # Parse every recipe once now, so queries can skip the LLM
+    print("⚡ Extracting structured recipes...")
+    with open(os.path.join(persist_dir, RECIPE_STORE_FILE), "w", encoding="utf-8") as f:
+        json.dump(build_recipe_store(recipes), f)
     return vectordb
 
-vectorstore = ensure_vectorstore()
+@st.cache_resource
+def get_vectorstore():
+    """Load the vectorstore once per process; shared across Streamlit reruns and sessions."""
+    return ensure_vectorstore()
+
+# -------------------------
+# Structured recipe store
+# -------------------------
+def build_recipe_store(recipes: list[str]) -> dict[str, list]:
+    """
+    Run the extraction prompt on each recipe chunk and return the results as parallel columns
+    (names, serves, ingredients, instructions), one entry per extracted recipe.
+    A chunk can hold several recipes (the title split misses some headings), so
+    rows[i] lists the recipe positions extracted from FAISS row i.
+    Rows the LLM could not parse are None and are extracted at query time instead.
+    """
+    responses = _RECIPE_STREAM.batch(
+        [_extraction_messages(r) for r in recipes],
+        config={"max_concurrency": RECIPE_STORE_CONCURRENCY},
+        return_exceptions=True
+    )
+    store = {"rows": [], "names": [], "serves": [], "ingredients": [], "instructions": []}
+    for response in responses:
+        try:
+            parsed = [Recipe.model_validate(r) for r in response["recipes"]]
+        except Exception:
+            parsed = []
+        if not parsed:
+            store["rows"].append(None)
+            continue
+        start = len(store["names"])
+        store["rows"].append(list(range(start, start + len(parsed))))
+        for recipe in parsed:
+            store["names"].append(recipe.name)
+            store["serves"].append(recipe.serves)
+            store["ingredients"].append(recipe.ingredients)
+            store["instructions"].append(recipe.instructions)
+    return store
+
+@st.cache_resource
+def get_recipe_store(persist_dir: str = PERSIST_DIR) -> dict[str, list] | None:
+    """Structured recipes saved next to the index, or None for indexes built without them."""
+    path = os.path.join(persist_dir, RECIPE_STORE_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        store = json.load(f)
+    return store if "rows" in store else None  # older one-recipe-per-row stores: rebuild
+
+def stored_recipes(docs: list[Document]) -> list[dict] | None:
+    """Structured recipes for the retrieved documents, or None if any of them isn't in the store."""
+    store = get_recipe_store()
+    if store is None:
+        return None
+    rows = list(dict.fromkeys(d.metadata.get("row") for d in docs))
+    if any(row is None or store["rows"][row] is None for row in rows):
+        return None
+    return [
+        {
+            "name": store["names"][i],
+            "serves": store["serves"][i],
+            "ingredients": list(store["ingredients"][i]),
+            "instructions": store["instructions"][i]
+        }
+        for row in rows
+        for i in store["rows"][row]
+    ]
+
+# -------------------------
+# Semantic query cache
+# -------------------------
+class SemanticCache:
+    """
+    Cache of past query_pdf_structured results, looked up by cosine similarity
+    of the query embedding (inner product on L2-normalized vectors).
+    Bounded to max_entries with least-recently-used eviction, persisted as a pickle
+    at most every save_interval seconds (and at exit), outside the lookup/add lock.
+    """
+
+    def __init__(
+        self,
+        path: str = QUERY_CACHE_PATH,
+        threshold: float = QUERY_CACHE_THRESHOLD,
+        max_entries: int = QUERY_CACHE_MAX_ENTRIES,
+        save_interval: float = QUERY_CACHE_SAVE_INTERVAL
+    ):
+        self.path = path
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.save_interval = save_interval
+        self.index = None
+        self.results: list[list[dict]] = []
+        self.last_used: list[float] = []  # parallel to results / index rows
+        self._lock = threading.Lock()       # guards index / results / last_used
+        self._save_lock = threading.Lock()  # one writer at a time, never held by lookup/add
+        self._dirty = False
+        self._last_save = time.time()
+        atexit.register(self.save)
+
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                serialized, self.results, self.last_used = pickle.load(f)
+            self.index = faiss.deserialize_index(serialized)
+
+    @staticmethod
+    def _normalize(embedding: list[float]) -> np.ndarray:
+        vector = np.array([embedding], dtype="float32")
+        faiss.normalize_L2(vector)
+        return vector
+
+    def lookup(self, embedding: list[float]) -> list[dict] | None:
+        """Return a copy of the cached result for the closest past query, if similar enough."""
+        with self._lock:
+            if self.index is None or self.index.ntotal == 0:
+                return None
+            scores, ids = self.index.search(self._normalize(embedding), 1)
+            i = int(ids[0][0])
+            if i == -1 or scores[0][0] < self.threshold:
+                return None
+            self.last_used[i] = time.time()
+            self._dirty = True  # saved with the next write, no write of its own
+            return copy.deepcopy(self.results[i])
+
+    def add(self, embedding: list[float], result: list[dict]) -> None:
+        """Store a result, evicting the least recently used entry when full; persist if a save is due."""
+        vector = self._normalize(embedding)
+        with self._lock:
+            if self.index is None:
+                self.index = faiss.IndexFlatIP(vector.shape[1])
+
+            if len(self.results) >= self.max_entries:
+                # remove_ids on a flat index shifts later rows down, like list.pop
+                oldest = self.last_used.index(min(self.last_used))
+                self.index.remove_ids(np.array([oldest], dtype="int64"))
+                self.results.pop(oldest)
+                self.last_used.pop(oldest)
+
+            self.index.add(vector)
+            self.results.append(copy.deepcopy(result))
+            self.last_used.append(time.time())
+            self._dirty = True
+            save_due = time.time() - self._last_save >= self.save_interval
+
+        if save_due:
+            self.save(blocking=False)
+
+    def save(self, blocking: bool = True) -> None:
+        """
+        Write the cache to disk if it changed. Only the snapshot is taken under the lock;
+        the pickle is written outside it, to a temp file that atomically replaces the old one.
+        With blocking=False, returns at once if another save is already running.
+        """
+        if not self._save_lock.acquire(blocking=blocking):
+            return
+        try:
+            with self._lock:
+                if not self._dirty:
+                    return
+                # Entries are never mutated after add(), so shallow copies are a consistent snapshot
+                snapshot = (faiss.serialize_index(self.index), list(self.results), list(self.last_used))
+                self._dirty = False
+                self._last_save = time.time()
+
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "wb") as f:
+                pickle.dump(snapshot, f)
+            os.replace(tmp_path, self.path)
+        finally:
+            self._save_lock.release()
+
+@st.cache_resource
+def get_query_cache() -> SemanticCache:
+    return SemanticCache()
 
 # -------------------------
 # Query PDF
 # -------------------------
-def query_pdf_structured(query: str) -> list[dict]:
+def _extraction_messages(text: str) -> list:
+    """Static instructions as the system message, recipe text last (cacheable prefix)."""
+    return [
+        SystemMessage(content=RECIPE_SYSTEM_PROMPT),
+        HumanMessage(content=f'Text:\n"""{text}"""')
+    ]
+
+def _stream_extracted_recipes(messages: list) -> Iterator[dict]:
     """
-    Retrieve relevant PDF chunks and extract structured recipes.
+    Yield each recipe from the streamed tool call as soon as it is complete,
+    i.e. once the model has started writing the next one (the last one when the stream ends).
+    """
+    emitted = 0
+    recipes = []
+    for partial in _RECIPE_STREAM.stream(messages):
+        recipes = (partial or {}).get("recipes") or []
+        while emitted < len(recipes) - 1:
+            yield Recipe.model_validate(recipes[emitted]).model_dump()
+            emitted += 1
+    for recipe in recipes[emitted:]:
+        yield Recipe.model_validate(recipe).model_dump()
+
+def _invoke_extracted_recipes(messages: list) -> Iterator[dict]:
+    """Yield the recipes of a single non-streamed call (goes through the global LLM cache)."""
+    for recipe in (_RECIPE_STREAM.invoke(messages) or {}).get("recipes") or []:
+        yield Recipe.model_validate(recipe).model_dump()
+
+def stream_pdf_recipes(query: str, incremental: bool = True) -> Iterator[dict]:
+    """
+    Retrieve relevant PDF chunks and yield structured recipes one by one.
     Each recipe dict includes: {name, serves, ingredients, instructions}
+    With incremental=True recipes are yielded as the LLM writes them; streamed calls bypass
+    the global LLM cache (.langchain.db), so callers that want the whole list use incremental=False.
     """
-    try:
-        retriever = vectorstore.as_retriever(search_kwargs={"k": 5})
-        docs = retriever.invoke(query)
+    # Exact repeats skip embedding, retrieval and the LLM entirely (key is sha256-hashed by the cache)
+    exact_key = query.strip().lower()
+    if exact_key in PDF_RESULT_CACHE:
+        logger.debug("Exact query cache hit")
+        yield from copy.deepcopy(PDF_RESULT_CACHE[exact_key])
+        return
 
-        if not docs:
-            print("DEBUG: No PDF chunks retrieved")
-            return []
+    # Paraphrased queries reuse a previous answer instead of calling the LLM again
+    embedding = embeddings.embed_query(query)
+    cached = get_query_cache().lookup(embedding)
+    if cached is not None:
+        logger.debug("Semantic cache hit")
+        yield from cached
+        return
 
-        # Debug: show first 300 chars of each retrieved chunk
-        for i, doc in enumerate(docs):
-            preview = doc.page_content[:300].replace("\n", " ")
-            print(f"DEBUG: Chunk {i} preview: {preview}...\n")
+    # Normalize like the stored vectors so inner product = cosine similarity
+    query_vector = np.array([embedding], dtype="float32")
+    faiss.normalize_L2(query_vector)
 
-        text = "\n\n".join([d.page_content for d in docs]).strip()
+    # MMR: pick diverse chunks so near-duplicate recipes don't bloat the prompt
+    docs = get_vectorstore().max_marginal_relevance_search_by_vector(
+        query_vector[0].tolist(), **MMR_SEARCH_KWARGS
+    )
 
-        # LLM prompt: force line-by-line ingredients and full instructions
-        recipe_prompt = PromptTemplate(
-            input_variables=["recipe_text"],
-            template="""
-You are a helpful recipe assistant.
-Extract COMPLETE recipes from the following text, without omitting any ingredients or instructions.
-Return as a JSON array with this format:
-[
-    {{
-    "name": "Recipe Name",
-    "serves": "X" or null,
-    "ingredients": ["ingredient 1", "ingredient 2", "ingredient 3"],
-    "instructions": "step 1. step 2. step 3."
-    }}
-]
-Instructions:
-- Keep each ingredient as one item in the list (do not merge multiple ingredients into one line).
-- Preserve all steps of the instructions, including multi-line notes.
-Text:
-\"\"\"{recipe_text}\"\"\"
-"""
-        )
+    if not docs:
+        logger.debug("No PDF chunks retrieved")
+        return
 
-        chain: RunnableSequence = recipe_prompt | llm
-        response = chain.invoke({"recipe_text": text}).content
-        print(f"DEBUG: LLM response:\n{response}\n")
+    # Recipes parsed at index build time: no LLM call needed
+    structured = stored_recipes(docs)
+    if structured is not None:
+        logger.debug("Recipe store hit")
+        yield from structured
+        return
 
-        try:
-            parsed = json.loads(response)
-        except json.JSONDecodeError:
-            print("DEBUG: JSON parse error, returning empty list")
-            parsed = []
+    # Debug: show first 300 chars of each retrieved chunk (string building skipped unless enabled)
+    if logger.isEnabledFor(logging.DEBUG):
+        for i, doc in enumerate(docs):
+            preview = doc.page_content[:300].replace("\n", " ")
+            logger.debug("Chunk %d preview: %s...", i, preview)
 
-        return parsed
+    # Drop chunks with identical text so the same bytes aren't sent to the LLM twice
+    seen, unique = set(), []
+    for d in docs:
+        h = hashlib.md5(d.page_content.encode()).digest()
+        if h not in seen:
+            seen.add(h)
+            unique.append(d.page_content)
+    text = "\n\n".join(unique).strip()[:MAX_PROMPT_CHARS]
 
+    parsed = []
+    extract = _stream_extracted_recipes if incremental else _invoke_extracted_recipes
+    for recipe in extract(_extraction_messages(text)):
+        parsed.append(recipe)
+        yield copy.deepcopy(recipe)  # callers tag/mutate results; keep the cached copy clean
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("LLM response:\n%s", parsed)
+
+    if parsed:
+        get_query_cache().add(embedding, parsed)
+        PDF_RESULT_CACHE[exact_key] = parsed
+
+def query_pdf_structured(query: str) -> list[dict]:
+    """
+    Retrieve relevant PDF chunks and extract structured recipes.
+    Each recipe dict includes: {name, serves, ingredients, instructions}
+    """
+    try:
+        return list(stream_pdf_recipes(query, incremental=False))
     except Exception as e:
         print(f"PDF extraction error: {e}")
         return []
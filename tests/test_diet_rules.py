@@ -0,0 +1,41 @@
+import unittest
+
+from diet_rules import DIET_PATTERNS, filter_diet_rules
+
+# (diet, ingredient, allowed)
+CASES = [
+    ("vegetarian", "lard", False),
+    ("vegetarian", "beef suet", False),
+    ("vegetarian", "leaf gelatine", False),
+    ("vegetarian", "gelatin", False),
+    ("vegetarian", "cheddar cheese", True),
+    ("vegan", "butter beans", True),
+    ("vegan", "cocoa butter", True),
+    ("vegan", "vegan cheese", True),
+    ("vegan", "vegan mayonnaise", True),
+    ("vegan", "plant-based butter", True),
+    ("vegan", "almond milk", True),
+    ("vegan", "butter", False),
+    ("vegan", "eggs", False),
+    ("lactose-free", "butter beans", True),
+    ("lactose-free", "dairy-free cream cheese", True),
+    ("lactose-free", "heavy cream", False),
+    ("gluten-free", "gluten-free pasta", True),
+    ("gluten-free", "whole wheat flour", False),
+    ("pescatarian", "salmon", True),
+]
+
+
+class DietRulesTest(unittest.TestCase):
+    def test_rules(self):
+        for diet, ingredient, allowed in CASES:
+            with self.subTest(diet=diet, ingredient=ingredient):
+                recipes = [{"name": "r", "ingredients": [ingredient]}]
+                self.assertEqual(bool(filter_diet_rules(recipes, DIET_PATTERNS[diet])), allowed)
+
+    def test_unknown_ingredients_are_dropped(self):
+        self.assertEqual(filter_diet_rules([{"name": "r", "ingredients": []}], DIET_PATTERNS["vegan"]), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
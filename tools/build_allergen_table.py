@@ -0,0 +1,67 @@
+"""
+Build allergens.json: allergen answers for the most common ingredients,
+loaded by agent_tools on the first allergen lookup so common ingredients never reach the LLM.
+
+Seeded from tools/top_ingredients.txt (common recipe ingredients, one per line)
+plus the ingredients found in spoonacular_cache.json.
+
+Usage (from the repo root):
+    python -m tools.build_allergen_table [--ingredients FILE] [--top 500]
+"""
+import os
+import json
+import argparse
+from collections import Counter
+from agent_tools import ALLERGEN_TABLE_PATH, classify_allergens, known_allergen
+
+SPOONACULAR_CACHE = "spoonacular_cache.json"
+SEED_INGREDIENTS = os.path.join(os.path.dirname(__file__), "top_ingredients.txt")
+DEFAULT_ALLERGENS = ["nut", "peanut", "gluten", "dairy", "egg", "soy", "shellfish", "fish", "sesame"]
+BATCH_SIZE = 10  # ingredients per LLM call: 10 x 9 allergens = 90 answers, well under the output limit
+
+
+def collect_ingredients(ingredients_file: str | None, top: int) -> list[str]:
+    """Most frequent ingredient names from the Spoonacular cache dump plus a one-per-line file (the seed list by default)."""
+    counts = Counter()
+    try:
+        with open(SPOONACULAR_CACHE) as f:
+            for recipe in json.load(f).values():
+                counts.update(ing.lower() for ing in recipe.get("ingredients", []))
+    except FileNotFoundError:
+        pass
+
+    if ingredients_file:
+        with open(ingredients_file) as f:
+            counts.update(line.strip().lower() for line in f if line.strip())
+
+    return [ing for ing, _ in counts.most_common(top)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ingredients", default=SEED_INGREDIENTS, help="Ingredient names, one per line")
+    parser.add_argument("--top", type=int, default=500, help="Number of most common ingredients to classify")
+    parser.add_argument("--allergens", nargs="+", default=DEFAULT_ALLERGENS)
+    args = parser.parse_args()
+
+    ingredients = collect_ingredients(args.ingredients, args.top)
+    allergens = [a.lower() for a in args.allergens]
+    print(f"Classifying {len(ingredients)} ingredients x {len(allergens)} allergens...")
+
+    for start in range(0, len(ingredients), BATCH_SIZE):
+        classify_allergens(set(ingredients[start:start + BATCH_SIZE]), allergens)
+
+    # Pairs still unknown (failed LLM calls) are left out rather than recorded as safe
+    table = {
+        f"{ing}|{allergy}": known
+        for ing in ingredients
+        for allergy in allergens
+        if (known := known_allergen((ing, allergy))) is not None
+    }
+    with open(ALLERGEN_TABLE_PATH, "w") as f:
+        json.dump(table, f, indent=2, sort_keys=True)
+    print(f"Wrote {len(table)} entries to {ALLERGEN_TABLE_PATH}")
+
+
+if __name__ == "__main__":
+    main()